@@ -9,11 +9,12 @@
 import struct
 from binascii import hexlify
 
-import Crypto.Cipher.AES
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.keywrap import InvalidUnwrap, aes_key_unwrap
 from hashlib import pbkdf2_hmac
  
 
-__all__ = ["Keybag", "AESdecryptCBC"]
+__all__ = ["Keybag", "AESdecryptCBC", "AESdecryptCBCStream"]
 
 
 _CLASSKEY_TAGS = [b"CLAS", b"WRAP", b"WPKY", b"KTYP", b"PBKY"]  # UUID
@@ -128,45 +129,44 @@ def _loopTLVBlocks(blob):
         i += 8 + length
 
 
-def _unpack64bit(s):
-    return struct.unpack(">Q", s)[0]
-
-
-def _pack64bit(s):
-    return struct.pack(">Q", s)
-
-
 def _AESUnwrap(kek, wrapped):
-    C = []
-    for i in range(len(wrapped)//8):
-        C.append(_unpack64bit(wrapped[i * 8:i * 8 + 8]))
-    n = len(C) - 1
-    R = [0] * (n+1)
-    A = C[0]
-
-    for i in range(1, n+1):
-        R[i] = C[i]
-
-    for j in reversed(range(0, 6)):
-        for i in reversed(range(1, n+1)):
-            todec = _pack64bit(A ^ (n * j + i))
-            todec += _pack64bit(R[i])
-            B = Crypto.Cipher.AES.new(kek, Crypto.Cipher.AES.MODE_ECB).decrypt(todec)
-            A = _unpack64bit(B[:8])
-            R[i] = _unpack64bit(B[8:])
-
-    if A != 0xa6a6a6a6a6a6a6a6:
+    # RFC 3394 AES key unwrap, done by OpenSSL rather than block-by-block in Python:
+    try:
+        return aes_key_unwrap(kek, wrapped)
+    except InvalidUnwrap:
         return None
-    res = b"".join(map(_pack64bit, R[1:]))
-    return res
 
 
 def AESdecryptCBC(data, key, iv=b"\x00" * 16):
     if len(data) % 16:
         print("WARN: AESdecryptCBC: data length not /16, truncating")
-        data = data[0:(len(data)/16) * 16]
-    data = Crypto.Cipher.AES.new(key, Crypto.Cipher.AES.MODE_CBC, iv).decrypt(data)
-    return data
+        data = data[0:(len(data)//16) * 16]
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor()
+    return decryptor.update(data) + decryptor.finalize()
+
+
+def AESdecryptCBCStream(infile, outfile, key, iv=b"\x00" * 16, padding=True, chunk_size=1 << 20):
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor()
+    # Hold back the final block, since it may contain padding which can only be removed at the end:
+    last_block = b""
+    while True:
+        chunk = infile.read(chunk_size)
+        if not chunk:
+            break
+        # The decryptor only returns whole blocks, so slice through a memoryview to avoid copying the chunk:
+        data = memoryview(decryptor.update(chunk))
+        if not data:
+            continue
+        outfile.write(last_block)
+        outfile.write(data[:-16])
+        last_block = bytes(data[-16:])
+    try:
+        last_block += decryptor.finalize()
+    except ValueError:
+        print("WARN: AESdecryptCBCStream: data length not /16, truncating")
+    if padding:
+        last_block = removePadding(last_block)
+    outfile.write(last_block)
 
 
 def removePadding(data, blocksize=16):
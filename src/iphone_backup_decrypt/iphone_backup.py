@@ -1,16 +1,72 @@
+import collections
+import functools
+import io
+import mmap
 import os.path
+import plistlib
 import shutil
 import sqlite3
 import struct
 import tempfile
-import re
-
-import biplist
+import urllib.request
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 from . import google_iphone_dataprotection
 
 __all__ = ["EncryptedBackup", "RelativePath", "RelativePathsLike"]
 
+# Decryption releases the GIL and the rest is disk I/O, so bulk extraction can use more threads than cores:
+_MAX_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+_MAX_PENDING_JOBS = 2 * _MAX_WORKERS
+# Read and write files in large chunks to keep the number of system calls down:
+_BUFFER_SIZE = 4 * 1024 * 1024
+# The decrypted Manifest.db is only ever read, so give it a large page cache and memory-mapped I/O:
+_MANIFEST_DB_PRAGMAS = (
+    "temp_store=MEMORY",
+    "cache_size=-262144",
+    "mmap_size=1073741824",
+    "query_only=ON",
+)
+# Stay below SQLite's default limits of 999 variables and 500 compound SELECT terms per statement:
+_MAX_SQL_VARIABLES = 900
+# Translation table to replace invalid filename characters:
+_INVALID_FILENAME_CHARS = str.maketrans({c: '_' for c in '\\/:*?"<>|'})
+
+
+def _read_file_keys(file_bplist):
+    # Extract the protection class and wrapped encryption key from a file's binary PList metadata.
+    # Returns None if the file is not encrypted; either a directory or empty.
+    plist = plistlib.loads(file_bplist)
+    file_data = plist['$objects'][plist['$top']['root'].data]
+    if "EncryptionKey" not in file_data:
+        return None
+    encryption_key = plist['$objects'][file_data['EncryptionKey'].data]['NS.data'][4:]
+    return file_data['ProtectionClass'], encryption_key
+
+
+def _top_level_directory(domain, relative_path):
+    # The first component of 'domain/relativePath', keeping its trailing '/' if it has one:
+    full_path = f"{domain}/{relative_path}" if relative_path else domain
+    separator = full_path.find('/')
+    return full_path if separator == -1 else full_path[:separator + 1]
+
+
+def _prefix_upper_bound(prefix):
+    # The smallest string greater than every string starting with 'prefix', for use in an indexed range query:
+    if not prefix:
+        return chr(0x10FFFF)
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _makedirs(directory, created_directories=None):
+    # Create a directory and its parents if necessary, skipping any already created during this extraction:
+    if created_directories is not None and directory in created_directories:
+        return
+    os.makedirs(directory, exist_ok=True)
+    if created_directories is not None:
+        created_directories.add(directory)
+
 
 class RelativePath:
     """Relative paths for commonly accessed files."""
@@ -78,6 +134,8 @@ class EncryptedBackup:
         self.decrypted = False
         # Keep track of the backup directory, and more dangerously, keep the backup passphrase as bytes until used:
         self._backup_directory = os.path.expandvars(backup_directory)
+        # Files are looked up inside the backup directory once per file, so keep its path with a trailing separator:
+        self._backup_prefix = os.path.join(self._backup_directory, '')
         self._passphrase = passphrase if type(passphrase) is bytes else passphrase.encode("utf-8")
         # Internals for unlocking the Keybag:
         self._manifest_plist_path = os.path.join(self._backup_directory, 'Manifest.plist')
@@ -119,40 +177,19 @@ class EncryptedBackup:
         
         try:
             cur = self._temp_manifest_db_conn.cursor()
-            
-            # Query to count files per directory and order by count
-            query = """
-            WITH CombinedPaths AS (
-                SELECT
-                    CASE
-                        WHEN relativePath = '' THEN domain
-                        ELSE domain || '/' || relativePath
-                    END AS fullPath
-                FROM Files
-            ),
-            Directories AS (
-                SELECT
-                    CASE
-                        WHEN INSTR(fullPath, '/') = 0 THEN fullPath
-                        ELSE SUBSTR(fullPath, 1, LENGTH(fullPath) - LENGTH(SUBSTR(fullPath, INSTR(fullPath, '/') + 1)))
-                    END AS directory
-                FROM CombinedPaths
-            )
-            SELECT
-                directory,
-                COUNT(*) as num_files
-            FROM Directories
-            GROUP BY directory
-            ORDER BY num_files DESC
-            LIMIT ?
-
-            """
-            
-            cur.execute(query, (limit,))
-            result = cur.fetchall()
+            cur.execute("SELECT domain, relativePath FROM Files;")
+
+            # Count files per directory in Python, which is a lot cheaper than splitting the paths up in SQL.
+            # The directory is the domain with a trailing '/', or the bare domain for the domain's own entry:
+            directory_counts = collections.Counter()
+            while True:
+                rows = cur.fetchmany(10000)
+                if not rows:
+                    break
+                directory_counts.update(_top_level_directory(domain, relative_path) for domain, relative_path in rows)
             cur.close()
-            
-            return result
+
+            return directory_counts.most_common(limit)
         
         except sqlite3.Error as e:
             raise ConnectionError(f"SQLite error occurred: {e}")
@@ -164,7 +201,7 @@ class EncryptedBackup:
             return self._unlocked
         # Open the Manifest.plist file to access the Keybag:
         with open(self._manifest_plist_path, 'rb') as infile:
-            self._manifest_plist = biplist.readPlist(infile)
+            self._manifest_plist = plistlib.load(infile)
         self._keybag = google_iphone_dataprotection.Keybag(self._manifest_plist['BackupKeyBag'])
         # Attempt to unlock the Keybag:
         self._unlocked = self._keybag.unlockWithPassphrase(self._passphrase)
@@ -181,7 +218,12 @@ class EncryptedBackup:
         try:
             # Connect to the decrypted Manifest.db database if necessary:
             if self._temp_manifest_db_conn is None:
-                self._temp_manifest_db_conn = sqlite3.connect(self._temp_decrypted_manifest_db_path)
+                # Open read-only and immutable, so that SQLite can skip all locking and journal checks:
+                uri = "file:{}?mode=ro&immutable=1".format(
+                    urllib.request.pathname2url(self._temp_decrypted_manifest_db_path))
+                self._temp_manifest_db_conn = sqlite3.connect(uri, uri=True)
+                for pragma in _MANIFEST_DB_PRAGMAS:
+                    self._temp_manifest_db_conn.execute(f"PRAGMA {pragma};")
             # Check that it has the expected table structure and a list of files:
             cur = self._temp_manifest_db_conn.cursor()
             cur.execute("SELECT count(*) FROM Files;")
@@ -194,53 +236,136 @@ class EncryptedBackup:
     def _decrypt_manifest_db_file(self):
         if os.path.exists(self._temp_decrypted_manifest_db_path):
             return
-        # Ensure we've already unlocked the Keybag:
-        self._read_and_unlock_keybag()
-        # Decrypt the Manifest.db index database:
-        manifest_key = self._manifest_plist['ManifestKey'][4:]
-        with open(self._manifest_db_path, 'rb') as encrypted_db_filehandle:
-            encrypted_db = encrypted_db_filehandle.read()
-        manifest_class = struct.unpack('<l', self._manifest_plist['ManifestKey'][:4])[0]
-        key = self._keybag.unwrapKeyForClass(manifest_class, manifest_key)
-        decrypted_data = google_iphone_dataprotection.AESdecryptCBC(encrypted_db, key)
-        # Write the decrypted Manifest.db temporarily to disk:
-        with open(self._temp_decrypted_manifest_db_path, 'wb') as decrypted_db_filehandle:
-            decrypted_db_filehandle.write(decrypted_data)
+        # Decrypt the Manifest.db index database temporarily to disk:
+        self._decrypt_manifest_db_to(self._temp_decrypted_manifest_db_path)
         # Open the temporary database to verify decryption success:
         if not self._open_temp_database():
+            # Don't leave the bad database behind, so that later calls report the error again:
+            if self._temp_manifest_db_conn is not None:
+                self._temp_manifest_db_conn.close()
+                self._temp_manifest_db_conn = None
+            os.remove(self._temp_decrypted_manifest_db_path)
             raise ConnectionError("Manifest.db file does not seem to be the right format!")
 
-    def _decrypt_inner_file(self, *, file_id, file_bplist):
+    def _decrypt_manifest_db_to(self, output_filename):
         # Ensure we've already unlocked the Keybag:
         self._read_and_unlock_keybag()
+        manifest_key = self._manifest_plist['ManifestKey'][4:]
+        manifest_class = struct.unpack('<l', self._manifest_plist['ManifestKey'][:4])[0]
+        key = self._keybag.unwrapKeyForClass(manifest_class, manifest_key)
+        # Memory-map the encrypted Manifest.db and decrypt it in chunks to a temporary name, only moving it
+        # into place once decryption has succeeded:
+        temp_output_filename = f"{output_filename}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(self._manifest_db_path, 'rb') as encrypted_db_filehandle, \
+                    open(temp_output_filename, 'xb') as decrypted_db_filehandle:
+                # An empty file can't be memory-mapped; leave the output empty so that it is rejected when opened:
+                if os.fstat(encrypted_db_filehandle.fileno()).st_size > 0:
+                    with mmap.mmap(encrypted_db_filehandle.fileno(), 0, access=mmap.ACCESS_READ) as encrypted_db:
+                        google_iphone_dataprotection.AESdecryptCBCStream(encrypted_db, decrypted_db_filehandle, key,
+                                                                         padding=False, chunk_size=_BUFFER_SIZE)
+            os.replace(temp_output_filename, output_filename)
+        finally:
+            if os.path.exists(temp_output_filename):
+                os.remove(temp_output_filename)
 
+    def _decrypt_inner_file(self, *, file_id, file_bplist):
         # Extract the decryption key from the PList data:
-        plist = biplist.readPlistFromString(file_bplist)
-        file_data = plist['$objects'][plist['$top']['root'].integer]
-        protection_class = file_data['ProtectionClass']
-        if "EncryptionKey" not in file_data:
+        file_keys = _read_file_keys(file_bplist)
+        if file_keys is None:
             print(f"File {file_id} is not encrypted.")
-            return None  # This file is not encrypted; either a directory or empty.
+            return None
+        protection_class, encryption_key = file_keys
+        return self._decrypt_inner_file_with_keys(
+            file_id=file_id, protection_class=protection_class, encryption_key=encryption_key
+        )
+
+    def _decrypt_inner_file_with_keys(self, *, file_id, protection_class, encryption_key):
+        # Decrypt the file contents into memory:
+        with io.BytesIO() as outfile:
+            if not self._decrypt_inner_file_to(file_id=file_id, protection_class=protection_class,
+                                               encryption_key=encryption_key, outfile=outfile):
+                return None
+            return outfile.getvalue()
 
-        encryption_key = plist['$objects'][file_data['EncryptionKey'].integer]['NS.data'][4:]
+    def _decrypt_inner_file_to(self, *, file_id, protection_class, encryption_key, outfile):
+        # Ensure we've already unlocked the Keybag:
+        self._read_and_unlock_keybag()
         inner_key = self._keybag.unwrapKeyForClass(protection_class, encryption_key)
 
-        # Find the encrypted version of the file on disk and decrypt it:
-        filename_in_backup = os.path.join(self._backup_directory, file_id[:2], file_id)
+        # Find the encrypted version of the file on disk:
+        filename_in_backup = f"{self._backup_prefix}{file_id[:2]}{os.sep}{file_id}"
         if not os.path.exists(filename_in_backup):
             print(f"Encrypted file {filename_in_backup} does not exist.")
-            return None
-
-        with open(filename_in_backup, 'rb') as encrypted_file_filehandle:
-            encrypted_data = encrypted_file_filehandle.read()
+            return False
 
-        # Decrypt the file contents:
+        # Decrypt the file contents in chunks, straight into the output file object:
         try:
-            decrypted_data = google_iphone_dataprotection.AESdecryptCBC(encrypted_data, inner_key)
-            return google_iphone_dataprotection.removePadding(decrypted_data)
+            with open(filename_in_backup, 'rb') as encrypted_file_filehandle:
+                google_iphone_dataprotection.AESdecryptCBCStream(encrypted_file_filehandle, outfile, inner_key,
+                                                                 chunk_size=_BUFFER_SIZE)
+            return True
         except Exception as e:
             print(f"Decryption failed for {file_id}. Error: {e}")
-            return None
+            return False
+
+    def _plan_extraction(self, rows):
+        # Parse the metadata of each (fileID, relativePath, file) row once, skipping files which are not encrypted,
+        # so that only (fileID, relativePath, protection_class, encryption_key) tuples are left to decrypt:
+        for file_id, relative_path, file_bplist in rows:
+            try:
+                file_keys = _read_file_keys(file_bplist)
+            except Exception as e:
+                print(f"Error occurred while processing file {relative_path}. Error: {str(e)}")
+                continue
+            if file_keys is None:
+                print(f"File {file_id} is not encrypted.")
+                continue
+            yield (file_id, relative_path, *file_keys)
+
+    def _extract_one(self, file_id, protection_class, encryption_key, output_path):
+        # Decrypt the file straight to disk under a temporary name, and only replace any existing output
+        # once decryption has succeeded:
+        temp_output_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_output_path, 'xb') as outfile:
+                decrypted = self._decrypt_inner_file_to(file_id=file_id, protection_class=protection_class,
+                                                        encryption_key=encryption_key, outfile=outfile)
+            if decrypted:
+                os.replace(temp_output_path, output_path)
+            return decrypted
+        finally:
+            if os.path.exists(temp_output_path):
+                os.remove(temp_output_path)
+
+    def _extract_concurrently(self, extract, jobs):
+        # Run 'extract(*job)' for every job on a thread pool; the last element of each job is its output path.
+        # Unlock the Keybag up front so the workers only ever read from it:
+        self._read_and_unlock_keybag()
+        in_flight = {}
+        pending = {}
+        with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as executor:
+            for job in jobs:
+                output_path = job[-1]
+                # Jobs writing to the same path must run in order, so that the last match wins:
+                if output_path in in_flight:
+                    in_flight[output_path].result()
+                # Only read ahead a bounded number of jobs, so that reading from the Manifest overlaps with the
+                # workers decrypting and writing files, without queueing up the whole backup in memory:
+                if len(pending) >= _MAX_PENDING_JOBS:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        # Surface any errors raised by the workers:
+                        future.result()
+                        finished_path = pending.pop(future)
+                        if in_flight.get(finished_path) is future:
+                            del in_flight[finished_path]
+                future = executor.submit(extract, *job)
+                pending[future] = output_path
+                in_flight[output_path] = future
+        # Surface any errors raised by the remaining workers:
+        for future in pending:
+            future.result()
 
 
     def test_decryption(self):
@@ -270,6 +395,14 @@ class EncryptedBackup:
             and examining the Files table.
         :return: decrypted bytes of the file.
         """
+        result = self._find_file(relative_path)
+        if result is None:
+            return None
+        file_id, file_bplist = result
+        # Decrypt the requested file:
+        return self._decrypt_inner_file(file_id=file_id, file_bplist=file_bplist)
+
+    def _find_file(self, relative_path):
         # Ensure that we've initialised everything:
         if self._temp_manifest_db_conn is None:
             self._decrypt_manifest_db_file()
@@ -286,20 +419,17 @@ class EncryptedBackup:
                 LIMIT 1;
             """
             cur.execute(query, (relative_path,))
-            result = cur.fetchone()
+            return cur.fetchone()
         except sqlite3.Error:
             return None
-        file_id, file_bplist = result
-        # Decrypt the requested file:
-        return self._decrypt_inner_file(file_id=file_id, file_bplist=file_bplist)
 
  
     def extract_file(self, *, relative_path, output_filename):
         """
         Decrypt a single named file and save it to disk.
 
-        This is a helper method and is exactly equivalent to extract_file_as_bytes(...) and then
-        writing that data to a file.
+        This is a helper method and is equivalent to extract_file_as_bytes(...) and then writing that
+        data to a file, except that the file is decrypted to disk in chunks rather than held in memory.
 
         :param relative_path:
             The iOS 'relativePath' of the file to be decrypted. Common relative paths are provided by the
@@ -308,20 +438,25 @@ class EncryptedBackup:
         :param output_filename:
             The filename to write the decrypted file contents to.
         """
-        # Get the decrypted bytes of the requested file:
-        decrypted_data = self.extract_file_as_bytes(relative_path)
+        # Find the requested file and its keys:
+        result = self._find_file(relative_path)
+        if result is None:
+            return
+        file_id, file_bplist = result
+        file_keys = _read_file_keys(file_bplist)
+        if file_keys is None:
+            print(f"File {file_id} is not encrypted.")
 
         # If the output_filename ends with a '/', it's treated as a directory, and the relative_path's basename is used.
         if output_filename.endswith('/'):
             output_filename = os.path.join(output_filename, os.path.basename(relative_path))
 
-        # Output them to disk:
+        # Output it to disk:
         output_directory = os.path.dirname(output_filename)
         if output_directory:
             os.makedirs(output_directory, exist_ok=True)
-        if decrypted_data is not None:
-            with open(output_filename, 'wb') as outfile:
-                outfile.write(decrypted_data)
+        if file_keys is not None:
+            self._extract_one(file_id, *file_keys, output_filename)
 
 
     def extract_files(self, *, relative_paths_like, output_folder):
@@ -355,20 +490,22 @@ class EncryptedBackup:
                 ORDER BY domain, relativePath;
             """
             cur.execute(query, (relative_paths_like,))
-            results = cur.fetchall()
         except sqlite3.Error:
             return None
-        # Ensure output destination exists then loop through matches:
+        # Ensure output destination exists then decrypt matches in parallel, streaming rows from the cursor
+        # rather than loading every match (and its metadata) into memory first:
         os.makedirs(output_folder, exist_ok=True)
-        for file_id, matched_relative_path, file_bplist in results:
-            filename = os.path.basename(matched_relative_path)
-            output_path = os.path.join(output_folder, filename)
-            # Decrypt the file:
-            decrypted_data = self._decrypt_inner_file(file_id=file_id, file_bplist=file_bplist)
-            # Output to disk:
-            if decrypted_data is not None:
-                with open(output_path, 'wb') as outfile:
-                    outfile.write(decrypted_data)
+        jobs = (
+            (file_id, protection_class, encryption_key,
+             os.path.join(output_folder, os.path.basename(matched_relative_path)))
+            for file_id, matched_relative_path, protection_class, encryption_key in self._plan_extraction(cur)
+        )
+        try:
+            self._extract_concurrently(self._extract_one, jobs)
+        except sqlite3.Error:
+            return None
+        finally:
+            cur.close()
 
     def fetch_files_from_directory(self, directory):
         """
@@ -404,6 +541,86 @@ class EncryptedBackup:
             print(f"Error occurred during fetch_files_from_directory: {e}")
             return []
 
+    def fetch_files_grouped_by_directory(self, directories):
+        """
+        Fetch all files underneath each of several directories/domains, using as few queries as possible.
+
+        Directories ending in '/' are treated as domains, as for fetch_files_from_directory. Any other directory
+        is matched as a case-sensitive prefix of the relativePath, so that the relativePath index can be used.
+
+        :param directories: The directories or domains to search files in.
+        :return: A dict mapping each directory to a list of fileIDs of files underneath it.
+        """
+        # Ensure that we've initialised everything:
+        if self._temp_manifest_db_conn is None:
+            self._decrypt_manifest_db_file()
+
+        directories = list(dict.fromkeys(directories))
+        grouped_file_ids = {directory: [] for directory in directories}
+
+        # Split the directories into domains, which can all be looked up with 'domain IN (...)',
+        # and relativePath prefixes, which each need their own indexed range:
+        directories_by_domain = collections.defaultdict(list)
+        prefixes = []
+        for directory in directories:
+            if directory.endswith('/'):
+                directories_by_domain[directory.rstrip('/')].append(directory)
+            else:
+                prefixes.append(directory)
+
+        try:
+            cur = self._temp_manifest_db_conn.cursor()
+            # Batch the parameters to stay within SQLite's limits on variables and compound SELECTs:
+            domains = list(directories_by_domain)
+            for start in range(0, len(domains), _MAX_SQL_VARIABLES):
+                batch = domains[start:start + _MAX_SQL_VARIABLES]
+                query = "SELECT domain, fileID FROM Files WHERE domain IN ({})".format(", ".join(["?"] * len(batch)))
+                for domain, file_id in cur.execute(query, batch):
+                    for directory in directories_by_domain[domain]:
+                        grouped_file_ids[directory].append(file_id)
+            for start in range(0, len(prefixes), _MAX_SQL_VARIABLES // 3):
+                batch = prefixes[start:start + _MAX_SQL_VARIABLES // 3]
+                query = " UNION ALL ".join(
+                    ["SELECT ?, fileID FROM Files WHERE relativePath >= ? AND relativePath < ?"] * len(batch))
+                parameters = []
+                for prefix in batch:
+                    parameters += [prefix, prefix, _prefix_upper_bound(prefix)]
+                for directory, file_id in cur.execute(query, parameters):
+                    grouped_file_ids[directory].append(file_id)
+            cur.close()
+            return grouped_file_ids
+        except sqlite3.Error as e:
+            print(f"Error occurred during fetch_files_grouped_by_directory: {e}")
+            return {directory: [] for directory in directories}
+
+
+    def iter_all_files(self):
+        """
+        Iterate over every file in the backup, using a single streaming query on the Manifest database.
+
+        :return: A generator of (domain, relativePath, fileID, file) tuples, where 'file' is the binary PList metadata.
+        """
+        # Ensure that we've initialised everything:
+        if self._temp_manifest_db_conn is None:
+            self._decrypt_manifest_db_file()
+
+        cur = self._temp_manifest_db_conn.cursor()
+        cur.arraysize = 1000
+        query = """
+            SELECT domain, relativePath, fileID, file
+            FROM Files
+            WHERE flags=1
+            ORDER BY domain, relativePath;
+        """
+        try:
+            cur.execute(query)
+            while True:
+                rows = cur.fetchmany()
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cur.close()
 
     def download_file(self, file_id, output_folder):
         """
@@ -434,49 +651,65 @@ class EncryptedBackup:
                 return None
 
             domain,relative_path, file_bplist = result[0]
-            if not relative_path:
-                print(f"Empty relativePath for fileID: {file_id}")
-                return None
-            #print(f"Relative path for file_id {file_id}: {relative_path}")
-         
+        except sqlite3.Error as e:
+            print(f"SQL Error: {e}")
+            return None
+
+        if not relative_path:
+            print(f"Empty relativePath for fileID: {file_id}")
+            return None
+        #print(f"Relative path for file_id {file_id}: {relative_path}")
+
+        #output_file_path = os.path.join(output_folder, os.path.basename(relative_path))
+        output_file_path = os.path.join(output_folder, domain, relative_path)
+        return self._download_file(file_id, relative_path, file_bplist, output_file_path)
+
+    def download_all_files(self, output_folder):
+        """
+        Download (and decrypt if necessary) every file in the backup, then save them to the specified folder.
 
+        This makes a single pass over the Manifest database, rather than looking up each file by its fileID.
+        Files are saved as '<output_folder>/<domain>/<relativePath>', exactly as download_file(...) would.
 
-            file_path_in_backup = os.path.join(self._backup_directory, file_id[:2], file_id) 
+        :param output_folder: The directory where you want to save the files.
+        """
+        jobs = (
+            (file_id, relative_path, file_bplist, os.path.join(output_folder, domain, relative_path))
+            for domain, relative_path, file_id, file_bplist in self.iter_all_files()
+            if relative_path
+        )
+        created_directories = set()
+        self._extract_concurrently(
+            functools.partial(self._download_file, created_directories=created_directories), jobs)
+
+    def _download_file(self, file_id, relative_path, file_bplist, output_file_path, created_directories=None):
+        try:
+            file_path_in_backup = f"{self._backup_prefix}{file_id[:2]}{os.sep}{file_id}"
             
             # Verify if the source file exists
             if not os.path.exists(file_path_in_backup):
                 print(f"Error: Source not found> {relative_path} ::::::: {file_path_in_backup}")
                 return None
 
-            #output_file_path = os.path.join(output_folder, os.path.basename(relative_path))
-            output_file_path = os.path.join(output_folder, domain, relative_path)
-
             # Check if the content is a directory
             # Ensure the parent directory exists
             parent_directory = os.path.dirname(output_file_path)
-            os.makedirs(parent_directory, exist_ok=True)
-            
-            file_data_object = biplist.readPlistFromString(file_bplist)
-            
+            _makedirs(parent_directory, created_directories)
+
+            # Parse the file metadata once, for both the encryption check and the keys:
+            file_keys = _read_file_keys(file_bplist)
+
             # If the file has encryption data, then decrypt it. Otherwise, just copy it
-            if "EncryptionKey" in file_data_object:
-                decrypted_content = self._decrypt_inner_file(file_id=file_id, file_bplist=file_bplist)
-                # If decrypted_content is None or empty, then there's an error in decryption or fetching
-                if decrypted_content is None or len(decrypted_content) == 0:
-                    print(f"Error: Empty content for {output_file_path}. Might be an issue with decryption or data retrieval.")
-                else:
-                    # Write the content to the file
-                    with open(output_file_path, 'wb') as out_file:
-                        out_file.write(decrypted_content)
+            if file_keys is not None:
+                # Decrypt the content straight to the output file; nothing is written if there's an error
+                if not self._extract_one(file_id, *file_keys, output_file_path):
+                    print(f"Error: No content for {output_file_path}. Might be an issue with decryption or data retrieval.")
             else:
                 print(f"File {file_id} is not encrypted. Directly copying..."+ output_file_path)
                 shutil.copy2(file_path_in_backup, output_file_path)
 
             return output_file_path
             
-        except sqlite3.Error as e:
-            print(f"SQL Error: {e}")
-            return None
         except Exception as e:
             print(f"Unexpected error: {e}")
             return None
@@ -494,44 +727,27 @@ class EncryptedBackup:
         if self._temp_manifest_db_conn is None:
             self._decrypt_manifest_db_file()
 
-        # Regular expression to replace invalid filename characters:
-        invalid_chars_pattern = re.compile(r'[\\/:*?"<>|]')
+        created_directories = set()
 
-        # Use Manifest.db to get all the files
+        def extract_one(file_id, matched_relative_path, protection_class, encryption_key, output_path):
+            # Ensure output destination exists, then decrypt the file and output to disk:
+            try:
+                _makedirs(os.path.dirname(output_path), created_directories)
+                self._extract_one(file_id, protection_class, encryption_key, output_path)
+            except Exception as e:
+                print(f"Error occurred while processing file {matched_relative_path}. Error: {str(e)}")
+
+        # Stream all the files from Manifest.db, sanitize each relative path by replacing invalid characters,
+        # then decrypt matches in parallel:
+        rows = ((file_id, relative_path, file_bplist) for _, relative_path, file_id, file_bplist in self.iter_all_files())
+        jobs = (
+            (file_id, matched_relative_path, protection_class, encryption_key,
+             os.path.join(output_folder, matched_relative_path.translate(_INVALID_FILENAME_CHARS)))
+            for file_id, matched_relative_path, protection_class, encryption_key in self._plan_extraction(rows)
+        )
         try:
-            cur = self._temp_manifest_db_conn.cursor()
-            query = """
-                SELECT fileID, relativePath, file
-                FROM Files
-                WHERE flags=1
-                ORDER BY domain, relativePath;
-            """
-            cur.execute(query)
-            results = cur.fetchall()
+            self._extract_concurrently(extract_one, jobs)
         except sqlite3.Error:
             print("Error querying the database.")
             return None
 
-        # Loop through matches:
-        for file_id, matched_relative_path, file_bplist in results:
-            # Sanitize the relative path by replacing invalid characters:
-            sanitized_path = invalid_chars_pattern.sub('_', matched_relative_path)
-
-            # Adjust the output path to maintain folder structure:
-            output_path = os.path.join(output_folder, sanitized_path)
-            output_directory = os.path.dirname(output_path)
-
-            # Ensure output destination exists:
-            os.makedirs(output_directory, exist_ok=True)
-
-            # Decrypt the file:
-            try:
-                decrypted_data = self._decrypt_inner_file(file_id=file_id, file_bplist=file_bplist)
-                
-                # Output to disk if successfully decrypted:
-                if decrypted_data is not None:
-                    with open(output_path, 'wb') as outfile:
-                        outfile.write(decrypted_data)
-            except Exception as e:
-                print(f"Error occurred while processing file {matched_relative_path}. Error: {str(e)}")
-
@@ -38,15 +38,8 @@ except Exception as e:
 #     dirs_with_most_files = backup.fetch_directory_with_most_files()
 #     print(dirs_with_most_files)
 
-#     # Iterate over directories and download all files under each directory
-#     for directory, _ in dirs_with_most_files:
-#         files_in_directory = backup.fetch_files_from_directory(directory)
-        
-#         # Specify the output folder where you want to download the files
-#         output_folder = f"./output/all/{directory.replace('/', '_')}/"  # Replace '/' with '_' to avoid subdirectories
-
-#         for file_id in files_in_directory:
-#             backup.download_file(file_id, output_folder)
+#     # Download all files in a single pass over the Manifest, saved under './output/all/<domain>/<relativePath>':
+#     backup.download_all_files("./output/all/")
 
 # except Exception as e:
 #     print(f"Error occurred: {e}")